@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
+from typing import Literal
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8', extra='ignore')
@@ -11,6 +12,24 @@ class Settings(BaseSettings):
     VLLM_BASE_URL: str = "http://localhost:10001"  # Base URL of the vLLM OpenAI-compatible server
     VLLM_CHAT_COMPLETIONS_ENDPOINT: str = "/v1/chat/completions" # Specific endpoint for chat
     VLLM_REQUEST_TIMEOUT: int = 1200 # seconds
+    # Negotiate HTTP/2 via ALPN when VLLM_BASE_URL is https:// (e.g. behind a
+    # reverse proxy). Plain http:// backends keep using HTTP/1.1.
+    VLLM_HTTP2: bool = True
+
+    # Backend connection pool. Long-lived SSE streams each hold a connection
+    # (over HTTP/1.1), so size the pool for the expected concurrent streams.
+    HTTP_MAX_CONNECTIONS: int = 200
+    HTTP_MAX_KEEPALIVE: int = 100
+    HTTP_KEEPALIVE_EXPIRY: float = 120.0 # seconds
+    # Ping the backend every N seconds (0 disables) so an idle gateway keeps a
+    # warm connection; keep this below HTTP_KEEPALIVE_EXPIRY.
+    VLLM_KEEPALIVE_PING_INTERVAL: float = 60.0
+    VLLM_HEALTH_ENDPOINT: str = "/health" # Cheap endpoint used for the ping
+    # Client used by the generic pass-through proxy (everything except chat
+    # completions). "aiohttp" has less per-chunk overhead, but its separate pool
+    # is HTTP/1.1 only (VLLM_HTTP2 is ignored) and is not kept warm by the
+    # keepalive ping above, which only covers the httpx pool.
+    VLLM_PROXY_BACKEND: Literal["httpx", "aiohttp"] = "httpx"
 
     # Default Qwen non-thinking mode parameters
     DEFAULT_TEMPERATURE: float = 0.7
@@ -8,8 +8,10 @@ def setup_logging():
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
-    # Uvicorn's access logs can be quite verbose on their own.
+    # Uvicorn's access logs can be quite verbose on their own, and
+    # RequestLoggingMiddleware already logs each request, so drop them entirely
+    # rather than filtering them per request.
+    logging.getLogger("uvicorn.access").disabled = True
     # If you want to reduce FastAPI/Uvicorn default logging noise:
-    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
     logging.getLogger("uvicorn.error").setLevel(logging.WARNING) # or ERROR
     logging.getLogger("fastapi").setLevel(logging.INFO) # Or your app's log level
\ No newline at end of file
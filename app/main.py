@@ -1,48 +1,91 @@
+import asyncio
 import logging
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
+import orjson
 from starlette.middleware.base import BaseHTTPMiddleware
 import time
 
 from app.core.config import settings, get_settings
 from app.core.logging_config import setup_logging
-from app.models.openai_schemas import ChatCompletionRequest # For the specific endpoint
+from app.models.openai_schemas import CHAT_COMPLETION_REQUEST_SCHEMAS # OpenAPI docs for the specific endpoint
 from app.services.vllm_service import (
     forward_chat_completion_request_to_vllm, # Renamed from forward_request_to_vllm
     forward_generic_request_to_vllm,         # New function
-    close_http_client
+    create_http_client,
+    create_proxy_session,
+    keep_backend_warm
 )
 
 get_settings()
 setup_logging()
 logger = logging.getLogger(__name__)
 
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (FastAPI's own ORJSONResponse is deprecated)."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Application startup: Initializing resources.")
-    # httpx client is initialized lazily
+    # One httpx client for the app's lifetime, created up front so the first
+    # request doesn't pay for it
+    app.state.http_client = create_http_client()
+    # The pass-through proxy (no body patching) shares the httpx client unless
+    # a separate aiohttp session is configured
+    if settings.VLLM_PROXY_BACKEND == "aiohttp":
+        app.state.proxy_client = create_proxy_session()
+    else:
+        app.state.proxy_client = app.state.http_client
+    keepalive_task = None
+    if settings.VLLM_KEEPALIVE_PING_INTERVAL > 0:
+        keepalive_task = asyncio.create_task(
+            keep_backend_warm(app.state.http_client, settings.VLLM_KEEPALIVE_PING_INTERVAL)
+        )
     yield
     logger.info("Application shutdown: Cleaning up resources.")
-    await close_http_client()
+    if keepalive_task is not None:
+        keepalive_task.cancel()
+        # Never let the pinger's outcome stop the clients below from closing
+        with suppress(asyncio.CancelledError, Exception):
+            await keepalive_task
+    await app.state.http_client.aclose()
+    if settings.VLLM_PROXY_BACKEND == "aiohttp":
+        await app.state.proxy_client.close()
 
 app = FastAPI(
     title="Qwen3 nothink API Gateway",
     description="An API gateway to forward requests to a vLLM backend, enabling Qwen's non-thinking mode for chat completions and proxying other requests.",
     version="0.2.0", # Version bump
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+_default_openapi = app.openapi
+
+def _openapi():
+    # Register the msgspec-generated request schemas referenced by the chat endpoint
+    schema = _default_openapi()
+    schema.setdefault("components", {}).setdefault("schemas", {}).update(CHAT_COMPLETION_REQUEST_SCHEMAS)
+    return schema
+app.openapi = _openapi
+
+HEALTH_PATH = "/gateway/health"
+
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
+        # Orchestrator probes hit the health check constantly; don't log them
+        if request.url.path == HEALTH_PATH or not logger.isEnabledFor(logging.INFO):
+            return await call_next(request)
+        start_time = time.perf_counter()
         response = await call_next(request)
-        process_time = time.time() - start_time
+        process_time = time.perf_counter() - start_time
         logger.info(
-            f"Request: {request.method} {request.url.path} - "
-            f"Response: {response.status_code} - "
-            f"Duration: {process_time:.4f}s"
+            "Request: %s %s - Response: %s - Duration: %.4fs",
+            request.method, request.url.path, response.status_code, process_time,
         )
         return response
 app.add_middleware(RequestLoggingMiddleware)
@@ -52,12 +95,12 @@ async def generic_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unhandled exception for {request.url.path}: {exc}", exc_info=True)
     # Avoid returning HTTPException directly here if it's already one
     if isinstance(exc, HTTPException):
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=exc.status_code,
             content={"detail": exc.detail},
             headers=exc.headers
         )
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "An unexpected internal server error occurred."},
     )
@@ -65,33 +108,47 @@ async def generic_exception_handler(request: Request, exc: Exception):
 # --- API Endpoints ---
 
 # 1. Specific route for Chat Completions (Qwen non-thinking mode applied)
-@app.post(settings.VLLM_CHAT_COMPLETIONS_ENDPOINT, summary="Forward Chat Completion Request to Qwen-vLLM with non-thinking mode")
-async def chat_completions_custom(
-    request_body: ChatCompletionRequest # Use the Pydantic model for request body validation
-):
+@app.post(
+    settings.VLLM_CHAT_COMPLETIONS_ENDPOINT,
+    summary="Forward Chat Completion Request to Qwen-vLLM with non-thinking mode",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ChatCompletionRequest"}}},
+        }
+    },
+)
+async def chat_completions_custom(request: Request):
     """
     Receives an OpenAI-compatible chat completion request, modifies it to enable
     Qwen's non-thinking mode, and forwards it to the vLLM backend server.
     """
+    body = await request.body()
     try:
-        return await forward_chat_completion_request_to_vllm(request_body)
+        return await forward_chat_completion_request_to_vllm(request.app.state.http_client, body)
     except HTTPException as e:
         raise e
     except Exception as e:
         logger.error(f"Error processing chat completion request: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# 2. Generic proxy for all other routes (e.g., /v1/models, /v1/completions (non-chat), etc.)
-# This route MUST be defined AFTER any specific routes like the one above.
+# 2. Gateway health check. Must be registered before the catch-all proxy below,
+# otherwise probes would be forwarded to the backend.
+@app.get(HEALTH_PATH, summary="Gateway Health Check", tags=["Gateway Management"])
+async def health_check():
+    return {"status": "ok", "service": "Qwen API Gateway"}
+
+# 3. Generic proxy for all other routes (e.g., /v1/models, /v1/completions (non-chat), etc.)
+# This route MUST be defined AFTER any specific routes like the ones above.
 @app.api_route("/{full_path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
 async def generic_proxy(request: Request): # Removed full_path from args as request.url.path is better
     """
     A generic proxy that forwards requests to the vLLM backend as-is.
     Handles paths like /v1/models, /v1/completions, etc.
     """
-    logger.info(f"Generic proxy handling request for: {request.method} {request.url.path}")
+    logger.info("Generic proxy handling request for: %s %s", request.method, request.url.path)
     try:
-        return await forward_generic_request_to_vllm(request)
+        return await forward_generic_request_to_vllm(request.app.state.proxy_client, request)
     except HTTPException as e: # Re-raise HTTPException to let FastAPI handle it
         raise e
     except Exception as e: # Catch any other unexpected errors from the service layer
@@ -99,10 +156,16 @@ async def generic_proxy(request: Request): # Removed full_path from args as requ
         raise HTTPException(status_code=500, detail=f"Internal server error during generic proxy: {str(e)}")
 
 
-@app.get("/gateway/health", summary="Gateway Health Check", tags=["Gateway Management"])
-async def health_check():
-    return {"status": "ok", "service": "Qwen API Gateway"}
-
 if __name__ == "__main__": # Keep for direct execution if needed
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level=settings.LOG_LEVEL.lower())
\ No newline at end of file
+    # RequestLoggingMiddleware already logs every request, so uvicorn's access
+    # log is redundant. X-Forwarded-* rewriting is off; enable proxy_headers only
+    # when the gateway sits behind a load balancer whose client IPs you need.
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        access_log=False,
+        proxy_headers=False,
+        log_level=settings.LOG_LEVEL.lower(),
+    )
\ No newline at end of file
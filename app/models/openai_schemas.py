@@ -1,18 +1,20 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional, Union
+import msgspec
+from typing import Annotated, List, Dict, Any, Optional, Union
 
-class Message(BaseModel):
+class Message(msgspec.Struct, kw_only=True):
     role: str
     content: str
 
-class ChatCompletionRequest(BaseModel):
+class ChatCompletionRequest(msgspec.Struct, kw_only=True, omit_defaults=True):
+    # Unknown fields are ignored during validation; the gateway forwards the
+    # client's JSON as-is, so extra parameters still reach the backend.
     model: str # This will be the model expected by the vLLM server
     messages: List[Message]
     temperature: Optional[float] = None
     top_p: Optional[float] = None
     top_k: Optional[int] = None
-    n: Optional[int] = Field(default=1, description="How many chat completion choices to generate for each input message.")
-    stream: Optional[bool] = Field(default=False, description="If set, partial message deltas will be sent, like in ChatGPT. Tokens will be sent as data-only server-sent events as they become available, with the stream terminated by a data: [DONE] message.")
+    n: Annotated[Optional[int], msgspec.Meta(description="How many chat completion choices to generate for each input message.")] = 1
+    stream: Annotated[Optional[bool], msgspec.Meta(description="If set, partial message deltas will be sent, like in ChatGPT. Tokens will be sent as data-only server-sent events as they become available, with the stream terminated by a data: [DONE] message.")] = False
     stop: Optional[Union[str, List[str]]] = None
     max_tokens: Optional[int] = None
     presence_penalty: Optional[float] = None
@@ -20,12 +22,15 @@ class ChatCompletionRequest(BaseModel):
     logit_bias: Optional[Dict[str, float]] = None
     user: Optional[str] = None
 
-    # To catch any other parameters clients might send
-    class Config:
-        extra = "allow"
-
-class BackendChatCompletionRequest(ChatCompletionRequest):
+class BackendChatCompletionRequest(ChatCompletionRequest, kw_only=True, omit_defaults=True):
     """
     Request model for the backend vLLM service, including Qwen-specific parameters.
     """
-    chat_template_kwargs: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    chat_template_kwargs: Optional[Dict[str, Any]] = None
+
+
+# OpenAPI components for the request body, since FastAPI cannot derive them
+# from a msgspec Struct.
+_, CHAT_COMPLETION_REQUEST_SCHEMAS = msgspec.json.schema_components(
+    [ChatCompletionRequest], ref_template="#/components/schemas/{name}"
+)
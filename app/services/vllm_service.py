@@ -1,7 +1,12 @@
+import aiohttp
+import asyncio
 import httpx
 import logging
 import json
-from typing import AsyncGenerator, Dict, Any
+import msgspec
+import orjson
+from typing import AsyncGenerator, Dict, Any, Tuple, Union
+from yarl import URL
 
 from fastapi import HTTPException, Request
 from starlette.responses import StreamingResponse
@@ -11,28 +16,121 @@ from app.models.openai_schemas import ChatCompletionRequest
 
 logger = logging.getLogger(__name__)
 
-_http_client: httpx.AsyncClient | None = None
+# Settings are fixed for the process lifetime, so per-request constants are
+# computed once at import.
+_CHAT_URL = f"{settings.VLLM_BASE_URL}{settings.VLLM_CHAT_COMPLETIONS_ENDPOINT}"
+_HEALTH_URL = f"{settings.VLLM_BASE_URL}{settings.VLLM_HEALTH_ENDPOINT}"
+
+# Injected into every chat request to switch Qwen3 into non-thinking mode
+_THINKING_OFF: Dict[str, Any] = {"enable_thinking": False}
+
+# Recommended non-thinking sampling parameters, used when the client omits them
+_CHAT_DEFAULTS: Dict[str, Any] = {
+    "temperature": settings.DEFAULT_TEMPERATURE,
+    "top_p": settings.DEFAULT_TOP_P,
+    "top_k": settings.DEFAULT_TOP_K,
+    "presence_penalty": settings.DEFAULT_PRESENCE_PENALTY,
+}
+
+
+def _compile_chat_defaults_applier():
+    """Generate a straight-line function that applies ``_CHAT_DEFAULTS`` and the
+    non-thinking kwargs to a payload dict in place, with the defaults baked in
+    as constants."""
+    lines = ["def _apply_chat_defaults(d):"]
+    lines += [f"    d.setdefault({key!r}, {value!r})" for key, value in _CHAT_DEFAULTS.items()]
+    lines.append("    d['chat_template_kwargs'] = _THINKING_OFF")
+    namespace: Dict[str, Any] = {"_THINKING_OFF": _THINKING_OFF}
+    exec("\n".join(lines), namespace)
+    return namespace["_apply_chat_defaults"]
+
+
+_apply_chat_defaults = _compile_chat_defaults_applier()
+
+# Hop-by-hop / framing headers that must not be copied between connections
+# (Content-Length is kept on requests: the body is streamed through unchanged.)
+_EXCLUDED_REQ_HEADERS = frozenset({"host", "transfer-encoding", "connection"})
+_EXCLUDED_RESP_HEADERS = frozenset({
+    "content-length",
+    "transfer-encoding",
+    "connection",
+    "content-encoding",   # body is forwarded decoded / re-framed
+})
+# The generic proxy forwards the body byte-for-byte, so its encoding and
+# length headers stay valid.
+_EXCLUDED_PASSTHROUGH_RESP_HEADERS = frozenset({"transfer-encoding", "connection"})
+# Headers the shared httpx client adds on its own; stripped from pass-through
+# requests the client sent without them
+_HTTPX_DEFAULT_REQ_HEADERS = ("accept", "accept-encoding", "user-agent")
 
 # ---------------------------------------------------------------------------
 # HTTP client helpers
 # ---------------------------------------------------------------------------
 
-async def get_http_client() -> httpx.AsyncClient:
-    """Return a singleton httpx.AsyncClient instance."""
-    global _http_client
-    if _http_client is None:
-        timeout = httpx.Timeout(settings.VLLM_REQUEST_TIMEOUT, connect=10)
-        limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
-        _http_client = httpx.AsyncClient(timeout=timeout, limits=limits)
-    return _http_client
+def create_http_client() -> httpx.AsyncClient:
+    """Build the shared httpx.AsyncClient; owned by the app lifespan."""
+    timeout = httpx.Timeout(settings.VLLM_REQUEST_TIMEOUT, connect=10)
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=settings.VLLM_HTTP2)
+
+
+def create_proxy_session() -> aiohttp.ClientSession:
+    """Build the aiohttp session for the generic pass-through proxy
+    (VLLM_PROXY_BACKEND=aiohttp).
+
+    aiohttp hands back larger raw chunks with less per-chunk Python overhead
+    than httpx, which matters when nothing needs patching. Bodies are not
+    decompressed and aiohttp's default headers are skipped, so only what the
+    client sent is forwarded and bytes go through as-is.
+    """
+    return aiohttp.ClientSession(
+        # Per-read limit like httpx's, so long streams aren't cut off mid-body
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=settings.VLLM_REQUEST_TIMEOUT),
+        connector=aiohttp.TCPConnector(
+            limit=settings.HTTP_MAX_CONNECTIONS,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        auto_decompress=False,
+        skip_auto_headers=("User-Agent", "Accept-Encoding", "Accept", "Content-Type"),
+    )
+
+
+async def keep_backend_warm(client: httpx.AsyncClient, interval: float) -> None:
+    """Periodically hit the backend health endpoint so that a pooled connection
+    stays open between traffic bursts and the next request skips the TCP/TLS
+    handshake. Runs until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await client.get(_HEALTH_URL, timeout=10)
+        except httpx.HTTPError as exc:
+            logger.debug("Backend keepalive ping failed: %s", exc)
+        except Exception as exc:
+            # e.g. httpx.InvalidURL from a bad VLLM_HEALTH_ENDPOINT; keep the
+            # task alive so shutdown isn't derailed by it
+            logger.warning("Backend keepalive ping error: %s", exc)
+
+# ---------------------------------------------------------------------------
+# JSON helpers – orjson on the hot path, stdlib json as fallback
+# ---------------------------------------------------------------------------
+
+def _json_loads(data: Union[bytes, memoryview]) -> Any:
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # orjson is stricter than the stdlib (e.g. NaN literals, lone surrogates)
+        return json.loads(bytes(data))
 
 
-async def close_http_client() -> None:
-    """Close shared HTTP client on application shutdown."""
-    global _http_client
-    if _http_client is not None:
-        await _http_client.aclose()
-        _http_client = None
+def _json_dumps(obj: Any) -> bytes:
+    try:
+        return orjson.dumps(obj)
+    except orjson.JSONEncodeError:
+        return json.dumps(obj).encode()
 
 # ---------------------------------------------------------------------------
 # Patch helpers – make Qwen/DeepSeek‑R1 reasoning output OpenAI‑compatible
@@ -55,68 +153,95 @@ def _patch_reasoning_in_message(msg: Dict[str, Any]) -> None:
     del msg["reasoning_content"]
 
 
-def _patch_reasoning_in_message(msg: Dict[str, Any]) -> None:
-    if msg.get("reasoning_content") is None:
-        return
-    if msg.get("content") in (None, ""):
-        msg["content"] = msg["reasoning_content"]
-    del msg["reasoning_content"]
-
-
 def _patch_reasoning_in_json_bytes(body: bytes) -> bytes:
+    # Fast path: nothing to patch, forward the backend bytes untouched
+    if b"reasoning_content" not in body:
+        return body
     try:
-        data = json.loads(body)
+        data = _json_loads(body)
         for choice in data.get("choices", []):
             _patch_reasoning_in_message(choice.get("message", {}))
-        return json.dumps(data).encode()
+        return _json_dumps(data)
     except Exception as exc:
         logger.warning("Reasoning JSON patch failed – forwarding raw body: %s", exc)
         return body
 
 
+def _patch_sse_event(event: bytes) -> bytes:
+    """Patch a single complete SSE event (without its ``\\n\\n`` terminator)."""
+    # One substring scan covers comments, [DONE] and ordinary token deltas
+    if b"reasoning_content" not in event or not event.startswith(b"data:"):
+        return event + b"\n\n"
+    try:
+        # Parse straight from the event buffer; JSON ignores the surrounding whitespace
+        obj = _json_loads(memoryview(event)[5:])
+    except Exception:
+        return event + b"\n\n"
+    delta = obj.get("choices", [{}])[0].get("delta", {})
+    if "reasoning_content" in delta:
+        if "content" not in delta or delta.get("content") in (None, ""):
+            delta["content"] = delta.pop("reasoning_content")
+        else:
+            delta.pop("reasoning_content", None)
+    obj["choices"][0]["delta"] = delta
+    return b"data: " + _json_dumps(obj) + b"\n\n"
+
+
+_SSE_DELIMITERS = (b"\n\n", b"\r\n\r\n", b"\r\r")
+
+
+def _find_event_end(buf: bytearray) -> Tuple[int, int]:
+    """Return (index, length) of the first SSE event delimiter in ``buf``; index is -1 if none."""
+    if b"\r" not in buf:
+        # vLLM frames with bare \n, so a single scan covers the common case
+        return buf.find(b"\n\n"), 2
+    best, best_len = -1, 0
+    for delimiter in _SSE_DELIMITERS:
+        idx = buf.find(delimiter)
+        if idx != -1 and (best == -1 or idx < best):
+            best, best_len = idx, len(delimiter)
+    return best, best_len
+
+
 async def _stream_patch(gen: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """Re-frame the backend byte stream into SSE events and patch each one.
+
+    Events may straddle chunk boundaries, so bytes are accumulated in a buffer
+    and only complete events (terminated by ``\\n\\n``, ``\\r\\n\\r\\n`` or
+    ``\\r\\r``) are processed.
+    """
+    buf = bytearray()
     async for chunk in gen:
-        try:
-            for event in chunk.split(b"\n\n"):
-                if not event.startswith(b"data:"):
-                    yield event + b"\n\n"
-                    continue
-                payload = event[5:].strip()
-                if payload == b"[DONE]":
-                    yield event + b"\n\n"
-                    continue
-                try:
-                    obj = json.loads(payload)
-                except Exception:
-                    yield event + b"\n\n"
-                    continue
-                delta = obj.get("choices", [{}])[0].get("delta", {})
-                if "reasoning_content" in delta:
-                    if "content" not in delta or delta.get("content") in (None, ""):
-                        delta["content"] = delta.pop("reasoning_content")
-                    else:
-                        delta.pop("reasoning_content", None)
-                obj["choices"][0]["delta"] = delta
-                yield b"data: " + json.dumps(obj).encode() + b"\n\n"
-        except Exception as exc:
-            logger.warning("Reasoning SSE patch error – forwarding original chunk: %s", exc)
-            yield chunk
+        buf.extend(chunk)
+        while True:
+            idx, delimiter_len = _find_event_end(buf)
+            if idx == -1:
+                break
+            event = bytes(buf[:idx])
+            del buf[:idx + delimiter_len]
+            try:
+                yield _patch_sse_event(event)
+            except Exception as exc:
+                logger.warning("Reasoning SSE patch error – forwarding original event: %s", exc)
+                yield event + b"\n\n"
+    if buf:
+        # Trailing bytes without a terminator – forward as-is
+        yield bytes(buf)
 
 # ---------------------------------------------------------------------------
 # Backend response handler
 # ---------------------------------------------------------------------------
 
+def _safe_response_headers(response: httpx.Response) -> Dict[str, str]:
+    # httpx already lower-cases header names in .items()
+    return {k: v for k, v in response.headers.items() if k not in _EXCLUDED_RESP_HEADERS}
+
+
 async def _handle_backend_response(
     response: httpx.Response,
     is_streaming_request: bool,
 ) -> StreamingResponse:
     """Proxy vLLM responses and normalise reasoning fields."""
-    excluded = {
-        "content-length",
-        "transfer-encoding",
-        "connection",
-        "content-encoding",   # 追加这一行
-    }
     # ------------------------------------------------------- STREAMING branch
     if is_streaming_request:
         if response.status_code != 200:
@@ -127,16 +252,23 @@ async def _handle_backend_response(
             )
             raise HTTPException(status_code=response.status_code, detail=error_payload.decode(errors="ignore"))
 
+        # SSE from vLLM is uncompressed, so skip httpx's decoder and read the
+        # raw socket bytes; fall back to decoding if the backend did compress.
+        if "content-encoding" in response.headers:
+            backend_stream = response.aiter_bytes()
+        else:
+            backend_stream = response.aiter_raw()
+
         async def patched_stream() -> AsyncGenerator[bytes, None]:
             try:
-                async for chunk in _stream_patch(response.aiter_bytes()):
+                async for chunk in _stream_patch(backend_stream):
                     yield chunk
             except httpx.StreamError as exc:
                 logger.error("Streaming interrupted: %s", exc)
             finally:
                 await response.aclose()
 
-        safe_headers = {k: v for k, v in response.headers.items() if k.lower() not in excluded}
+        safe_headers = _safe_response_headers(response)
         return StreamingResponse(
             patched_stream(),
             media_type=response.headers.get("content-type", "text/event-stream"),
@@ -148,7 +280,7 @@ async def _handle_backend_response(
     response_content = await response.aread()
     await response.aclose()
 
-    safe_headers = {k: v for k, v in response.headers.items() if k.lower() not in excluded}
+    safe_headers = _safe_response_headers(response)
 
     if response.status_code >= 400:
         logger.error("Backend error %s: %s", response.status_code, response_content.decode(errors="ignore"))
@@ -167,29 +299,75 @@ async def _handle_backend_response(
         headers=safe_headers,
     )
 
+async def _passthrough_backend_response(response: httpx.Response) -> StreamingResponse:
+    """Forward a vLLM response unmodified, streaming the raw body without buffering it."""
+    if response.status_code >= 400:
+        logger.error("Backend error %s for %s", response.status_code, response.request.url.path)
+
+    async def raw_stream() -> AsyncGenerator[bytes, None]:
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        except httpx.StreamError as exc:
+            logger.error("Streaming interrupted: %s", exc)
+        finally:
+            await response.aclose()
+
+    headers = {k: v for k, v in response.headers.items() if k not in _EXCLUDED_PASSTHROUGH_RESP_HEADERS}
+    return StreamingResponse(raw_stream(), status_code=response.status_code, headers=headers)
+
+
+async def _passthrough_aiohttp_response(response: aiohttp.ClientResponse) -> StreamingResponse:
+    """aiohttp counterpart of ``_passthrough_backend_response``."""
+    if response.status >= 400:
+        logger.error("Backend error %s for %s", response.status, response.url.path)
+
+    async def raw_stream() -> AsyncGenerator[bytes, None]:
+        try:
+            async for chunk in response.content.iter_any():
+                yield chunk
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logger.error("Streaming interrupted: %s", exc)
+        finally:
+            response.release()
+
+    headers = {
+        k: v for k, v in response.headers.items() if k.lower() not in _EXCLUDED_PASSTHROUGH_RESP_HEADERS
+    }
+    return StreamingResponse(raw_stream(), status_code=response.status, headers=headers)
+
 # ---------------------------------------------------------------------------
 # Chat‑completion forwarder (forces enable_thinking=False)
 # ---------------------------------------------------------------------------
 
 async def forward_chat_completion_request_to_vllm(
-    original_chat_request: ChatCompletionRequest,
+    client: httpx.AsyncClient,
+    raw_body: bytes,
 ) -> StreamingResponse:
-    client = await get_http_client()
-    target_url = f"{settings.VLLM_BASE_URL}{settings.VLLM_CHAT_COMPLETIONS_ENDPOINT}"
-
-    payload: Dict[str, Any] = original_chat_request.model_dump(exclude_unset=True)
-    payload["chat_template_kwargs"] = {"enable_thinking": False}
-
-    payload.setdefault("temperature", settings.DEFAULT_TEMPERATURE)
-    payload.setdefault("top_p", settings.DEFAULT_TOP_P)
-    payload.setdefault("top_k", settings.DEFAULT_TOP_K)
-    payload.setdefault("presence_penalty", settings.DEFAULT_PRESENCE_PENALTY)
-    payload.setdefault("model", original_chat_request.model)
 
-    is_stream = bool(payload.get("stream"))
+    # Work on the client's JSON as sent: one parse, one serialise. Unset fields
+    # stay unset and extra parameters are preserved.
+    try:
+        payload: Dict[str, Any] = _json_loads(raw_body)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Request body is not valid JSON.")
+    try:
+        # Validate the parsed dict in place of the old Pydantic body model
+        chat_request = msgspec.convert(payload, ChatCompletionRequest, strict=False)
+    except msgspec.ValidationError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    _apply_chat_defaults(payload)
+
+    # Use the coerced value (e.g. "false" -> False) and forward it, so the
+    # backend and the gateway agree on whether the response is streamed
+    is_stream = bool(chat_request.stream)
+    if "stream" in payload:
+        payload["stream"] = chat_request.stream
 
     try:
-        req = client.build_request("POST", target_url, json=payload)
+        req = client.build_request(
+            "POST", _CHAT_URL, content=_json_dumps(payload), headers={"content-type": "application/json"}
+        )
         resp = await client.send(req, stream=is_stream)
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Gateway timeout: backend LLM did not respond in time.")
@@ -203,26 +381,60 @@ async def forward_chat_completion_request_to_vllm(
 # Generic proxy endpoint – forwards everything else unchanged
 # ---------------------------------------------------------------------------
 
-async def forward_generic_request_to_vllm(request: Request) -> StreamingResponse:
-    client = await get_http_client()
+async def forward_generic_request_to_vllm(
+    client: Union[httpx.AsyncClient, aiohttp.ClientSession],
+    request: Request,
+) -> StreamingResponse:
+    """Forward a request unchanged through either proxy client (see VLLM_PROXY_BACKEND)."""
 
-    path_and_query = request.url.path + ("?" + request.url.query if request.url.query else "")
+    # Forward the path exactly as the client encoded it
+    raw_path = request.scope.get("raw_path") or request.url.path.encode()
+    query = request.scope.get("query_string", b"")
+    path_and_query = raw_path.decode("latin-1") + ("?" + query.decode("latin-1") if query else "")
     target_url = f"{settings.VLLM_BASE_URL}{path_and_query}"
 
-    excluded = {"host", "content-length", "transfer-encoding", "connection"}
-    headers = {k: v for k, v in request.headers.items() if k.lower() not in excluded}
+    # Starlette already lower-cases header names
+    headers = [(k, v) for k, v in request.headers.items() if k not in _EXCLUDED_REQ_HEADERS]
 
-    body = await request.body()
+    # Stream the client body straight to the backend instead of buffering it;
+    # requests without a body (e.g. GET /v1/models) send none at all.
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    body = request.stream() if has_body else None
 
-    expect_stream = "text/event-stream" in request.headers.get("accept", "").lower()
+    # Only chat completions carry reasoning fields to patch; everything else is
+    # streamed through as-is, whether or not the client asked for SSE.
+    if isinstance(client, aiohttp.ClientSession):
+        if "accept-encoding" not in request.headers:
+            # No Accept-Encoding would let the backend pick any coding
+            headers.append(("accept-encoding", "identity"))
+        try:
+            resp = await client.request(
+                request.method,
+                URL(target_url, encoded=True), # stop yarl from encoding the path again
+                headers=headers,
+                data=body,
+                allow_redirects=False,
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Gateway timeout: backend LLM did not respond in time.")
+        except aiohttp.ClientError as exc:
+            logger.error("Cannot reach backend: %s", exc)
+            raise HTTPException(status_code=503, detail="Backend LLM service unreachable.")
+        return await _passthrough_aiohttp_response(resp)
 
     try:
-        req = client.build_request(request.method, target_url, headers=headers, content=body or None)
+        req = client.build_request(request.method, target_url, headers=headers, content=body)
+        # The body is relayed undecoded, so only send what the client sent
+        # rather than httpx's defaults: no Accept-Encoding means identity.
+        for name in _HTTPX_DEFAULT_REQ_HEADERS:
+            if name not in request.headers:
+                del req.headers[name]
+        if "accept-encoding" not in request.headers:
+            req.headers["accept-encoding"] = "identity"
         resp = await client.send(req, stream=True)
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Gateway timeout: backend LLM did not respond in time.")
     except (httpx.ConnectError, httpx.RequestError) as exc:
         logger.error("Cannot reach backend: %s", exc)
         raise HTTPException(status_code=503, detail="Backend LLM service unreachable.")
-
-    return await _handle_backend_response(resp, expect_stream)
+    return await _passthrough_backend_response(resp)